@@ -1,9 +1,12 @@
 import argparse
-from dataclasses import dataclass
-from datetime import datetime
-from typing import List, Optional
+import glob
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import joblib
+import numpy as np
 import pandas as pd
 
 from feature_engineering import generate_features
@@ -12,69 +15,78 @@ from position_sizer import PositionSizer
 from risk_engine import RiskEngine
 from trade_guard import TradeGuard
 
-
-@dataclass
-class Candle:
-    time: datetime
-    open: float
-    high: float
-    low: float
-    close: float
-    volume: float
+MIN_HISTORY = 200
+OHLCV_DTYPES = {c: np.float32 for c in ("open", "high", "low", "close", "volume")}
 
 
 def load_ohlcv(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    header = pd.read_csv(path, nrows=0)
     required = {"datetime", "open", "high", "low", "close", "volume"}
-    missing = required - set(df.columns)
+    missing = required - set(header.columns)
     if missing:
         raise ValueError(f"Missing required columns: {sorted(missing)}")
-    df["datetime"] = pd.to_datetime(df["datetime"], utc=True, errors="coerce")
-    df = df.dropna(subset=["datetime"]).sort_values("datetime").reset_index(drop=True)
-    return df
-
-
-def build_feature_row(history_df: pd.DataFrame, feature_names: List[str]) -> Optional[pd.DataFrame]:
-    if len(history_df) < 200:
-        return None
-    feat = generate_features(history_df)
-    if feat.empty:
-        return None
-    x = feat.drop(columns=["datetime"], errors="ignore").tail(1).copy()
-    for col in feature_names:
-        if col not in x.columns:
-            x[col] = 0.0
-    return x[feature_names]
-
-
-def max_drawdown_pct(equity_curve: List[float]) -> float:
-    if not equity_curve:
+
+    read_kwargs = {"dtype": OHLCV_DTYPES, "parse_dates": ["datetime"]}
+    try:
+        df = pd.read_csv(path, engine="pyarrow", **read_kwargs)
+    except ImportError:
+        df = pd.read_csv(path, **read_kwargs)
+
+    dt = df["datetime"]
+    if not pd.api.types.is_datetime64_any_dtype(dt):
+        # mixed offsets or junk rows: fall back to per-value parsing
+        dt = pd.to_datetime(dt, utc=True, errors="coerce")
+    elif dt.dt.tz is None:
+        dt = dt.dt.tz_localize("UTC")
+    else:
+        dt = dt.dt.tz_convert("UTC")
+    df["datetime"] = dt
+
+    if dt.isna().any():
+        df = df.dropna(subset=["datetime"])
+    if not df["datetime"].is_monotonic_increasing:
+        df = df.sort_values("datetime")
+    return df.reset_index(drop=True)
+
+
+def build_feature_matrix(df: pd.DataFrame, feature_names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute features once over the full series, row-aligned with `df`."""
+    feat = generate_features(df, dropna=False)
+    x = feat.reindex(columns=feature_names, fill_value=0.0).to_numpy(dtype=np.float32)
+    valid = ~np.isnan(x).any(axis=1)
+    valid[: MIN_HISTORY - 1] = False
+    return x, valid
+
+
+def max_drawdown_pct(equity_curve: np.ndarray) -> float:
+    if len(equity_curve) == 0:
         return 0.0
-    peak = equity_curve[0]
-    mdd = 0.0
-    for e in equity_curve:
-        if e > peak:
-            peak = e
-        dd = (peak - e) / peak * 100.0 if peak > 0 else 0.0
-        if dd > mdd:
-            mdd = dd
-    return mdd
+    equity = np.asarray(equity_curve, dtype=np.float64)
+    peaks = np.maximum.accumulate(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.where(peaks > 0, (peaks - equity) / peaks * 100.0, 0.0)
+    return float(dd.max())
 
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--data", required=True, help="OHLCV CSV with datetime/open/high/low/close/volume")
-    ap.add_argument("--model", default="model_champion.pkl")
-    ap.add_argument("--entry-threshold", type=float, default=0.60)
-    ap.add_argument("--tp", type=float, default=0.015)
-    ap.add_argument("--sl", type=float, default=0.009)
-    ap.add_argument("--initial-balance", type=float, default=1_000_000)
-    ap.add_argument("--history-len", type=int, default=600)
-    ap.add_argument("--export-trades", default="", help="Optional output CSV path for trade history")
-    args = ap.parse_args()
+def save_trades(trades: pd.DataFrame, path: str) -> None:
+    if path.endswith(".parquet"):
+        trades.to_parquet(path, engine="pyarrow", compression="zstd", index=False)
+    else:
+        trades.to_csv(path, index=False)
+
+
+def trade_export_path(export_trades: str, data_path: str) -> str:
+    """Per-market export path, e.g. trades.csv + data_KRW_BTC_5m.csv -> trades_data_KRW_BTC_5m.csv."""
+    root, ext = os.path.splitext(export_trades)
+    stem = os.path.splitext(os.path.basename(data_path))[0]
+    return f"{root}_{stem}{ext or '.csv'}"
 
+
+def run_one(args: argparse.Namespace) -> Dict[str, Any]:
     model = joblib.load(args.model)
-    feature_names = list(getattr(model, "feature_name", lambda: [])() or [])
+    # sklearn wrappers keep the native Booster in booster_; predict on it directly
+    booster = getattr(model, "booster_", model)
+    feature_names = list(getattr(booster, "feature_name", lambda: [])() or [])
     if not feature_names:
         raise ValueError("Model has no feature_name metadata. Train with current pipeline first.")
 
@@ -84,81 +96,151 @@ def main():
     guard = TradeGuard(risk, sizer)
     paper = PaperTrader(initial_balance=args.initial_balance, fee=0.001)
 
-    history: List[Candle] = []
-    equity_curve: List[float] = []
-
-    for row in df.itertuples(index=False):
-        candle = Candle(
-            time=row.datetime,
-            open=float(row.open),
-            high=float(row.high),
-            low=float(row.low),
-            close=float(row.close),
-            volume=float(row.volume),
+    feat_matrix, feat_valid = build_feature_matrix(df, feature_names)
+    # one batched call instead of a predict per bar; warmup rows stay NaN
+    proba_all = np.full(len(df), np.nan)
+    if feat_valid.any():
+        proba_all[feat_valid] = booster.predict(
+            feat_matrix[feat_valid],
+            num_iteration=booster.best_iteration,
+            predict_disable_shape_check=True,
         )
-        history.append(candle)
-        if len(history) > args.history_len:
-            history.pop(0)
 
-        if paper.can_sell():
-            paper.check_tp_sl(high=candle.high, low=candle.low, timestamp=candle.time, tp=args.tp, sl=args.sl)
-            if not paper.can_sell():
-                last_sell = next((h for h in reversed(paper.history) if h.get("type") == "SELL"), None)
-                if last_sell:
-                    risk.record_trade_result(float(last_sell.get("pnl", 0.0)), candle.time)
-
-        if paper.can_buy():
-            hist_df = pd.DataFrame(
-                [
-                    {
-                        "datetime": c.time,
-                        "open": c.open,
-                        "high": c.high,
-                        "low": c.low,
-                        "close": c.close,
-                        "volume": c.volume,
-                    }
-                    for c in history
-                ]
-            )
-            x = build_feature_row(hist_df, feature_names)
-            if x is not None:
-                proba = float(model.predict(x)[0])
-                if proba >= args.entry_threshold:
-                    decision = guard.evaluate_entry(
-                        equity_krw=paper.balance,
-                        now=candle.time,
-                        price=candle.close,
-                        stop_pct=args.sl,
-                    )
-                    if decision.allowed and decision.sizing is not None:
-                        paper.buy(price=candle.close, timestamp=candle.time, spend_krw=decision.sizing.krw_to_spend)
+    times = df["datetime"]
+    closes = df["close"].to_numpy(np.float64)
+    highs = df["high"].to_numpy(np.float64)
+    lows = df["low"].to_numpy(np.float64)
+    n = len(df)
+
+    # marked-to-market equity per bar, written by index
+    equity_curve = np.empty(n, dtype=np.float64)
+    pending_exit: Optional[Tuple[int, float, str]] = None
+
+    i = 0
+    while i < n:
+        if pending_exit is not None:
+            _, exit_price, reason = pending_exit
+            pending_exit = None
+            pnl = paper.sell(exit_price, times.iat[i], reason)
+            if pnl is not None:
+                risk.record_trade_result(pnl, times.iat[i])
+
+        if paper.can_buy() and feat_valid[i]:
+            proba = float(proba_all[i])
+            if proba >= args.entry_threshold:
+                now = times.iat[i]
+                price = float(closes[i])
+                decision = guard.evaluate_entry(
+                    equity_krw=paper.balance,
+                    now=now,
+                    price=price,
+                    stop_pct=args.sl,
+                )
+                if decision.allowed and decision.sizing is not None:
+                    paper.buy(price=price, timestamp=now, spend_krw=decision.sizing.krw_to_spend)
 
         marked_equity = paper.balance
         if paper.can_sell():
-            marked_equity += paper.position * candle.close * (1 - paper.fee)
-        equity_curve.append(marked_equity)
-
-    sells = [h for h in paper.history if h.get("type") == "SELL"]
-    total_pnl = sum(float(h.get("pnl", 0.0)) for h in sells)
-    wins = sum(1 for h in sells if float(h.get("pnl", 0.0)) > 0)
-    win_rate = (wins / len(sells) * 100.0) if sells else 0.0
-    final_equity = equity_curve[-1] if equity_curve else args.initial_balance
+            marked_equity += paper.position * closes[i] * (1 - paper.fee)
+        equity_curve[i] = marked_equity
+
+        if paper.can_sell():
+            # Resolve the whole holding period at once and jump to the exit bar.
+            exit_hit = paper.find_tp_sl_exit(highs[i + 1 :], lows[i + 1 :], tp=args.tp, sl=args.sl)
+            stop = n if exit_hit is None else i + 1 + exit_hit[0]
+            equity_curve[i + 1 : stop] = paper.balance + paper.position * closes[i + 1 : stop] * (1 - paper.fee)
+            if exit_hit is None:
+                break
+            pending_exit = exit_hit
+            i = stop
+            continue
+
+        i += 1
+
+    trades = paper.to_dataframe()
+    sells = trades[trades["type"] == "SELL"]
+    total_pnl = float(sells["pnl"].sum())
+    wins = int((sells["pnl"] > 0).sum())
+    win_rate = (wins / len(sells) * 100.0) if len(sells) else 0.0
+    final_equity = float(equity_curve[-1]) if n else args.initial_balance
     ret_pct = (final_equity - args.initial_balance) / args.initial_balance * 100.0
     mdd = max_drawdown_pct(equity_curve)
 
+    if args.export_trades:
+        save_trades(trades, args.export_trades)
+
+    return {
+        "data": args.data,
+        "rows": len(df),
+        "trades": len(sells),
+        "win_rate": win_rate,
+        "total_pnl": total_pnl,
+        "final_equity": final_equity,
+        "return_pct": ret_pct,
+        "max_drawdown_pct": mdd,
+        "export_trades": args.export_trades,
+    }
+
+
+def print_result(result: Dict[str, Any]) -> None:
     print("===== REPLAY RESULT =====")
-    print(f"Rows: {len(df)}")
-    print(f"Trades (SELL): {len(sells)}")
-    print(f"Win rate: {win_rate:.2f}%")
-    print(f"Total PnL: {total_pnl:.2f}")
-    print(f"Final Equity: {final_equity:.2f}")
-    print(f"Return: {ret_pct:.2f}%")
-    print(f"Max Drawdown: {mdd:.2f}%")
+    print(f"Data: {result['data']}")
+    print(f"Rows: {result['rows']}")
+    print(f"Trades (SELL): {result['trades']}")
+    print(f"Win rate: {result['win_rate']:.2f}%")
+    print(f"Total PnL: {result['total_pnl']:.2f}")
+    print(f"Final Equity: {result['final_equity']:.2f}")
+    print(f"Return: {result['return_pct']:.2f}%")
+    print(f"Max Drawdown: {result['max_drawdown_pct']:.2f}%")
+    if result["export_trades"]:
+        print(f"Saved trades: {result['export_trades']}")
 
-    if args.export_trades:
-        pd.DataFrame(paper.history).to_csv(args.export_trades, index=False)
-        print(f"Saved trades: {args.export_trades}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--data", help="OHLCV CSV with datetime/open/high/low/close/volume")
+    src.add_argument("--data-glob", help="Glob of OHLCV CSVs; each file is replayed in its own process")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Process count for --data-glob")
+    ap.add_argument("--model", default="model_champion.pkl")
+    ap.add_argument("--entry-threshold", type=float, default=0.60)
+    ap.add_argument("--tp", type=float, default=0.015)
+    ap.add_argument("--sl", type=float, default=0.009)
+    ap.add_argument("--initial-balance", type=float, default=1_000_000)
+    ap.add_argument(
+        "--export-trades",
+        default="",
+        help="Optional trade history output; .parquet writes zstd Parquet, anything else CSV (suffixed per file with --data-glob)",
+    )
+    args = ap.parse_args()
+
+    if args.data:
+        print_result(run_one(args))
+        return
+
+    paths = sorted(glob.glob(args.data_glob))
+    if not paths:
+        raise ValueError(f"No files match: {args.data_glob}")
+
+    jobs = []
+    for path in paths:
+        export = trade_export_path(args.export_trades, path) if args.export_trades else ""
+        jobs.append(argparse.Namespace(**{**vars(args), "data": path, "export_trades": export}))
+
+    # spawn: each worker loads the model from disk instead of inheriting a forked Booster
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as ex:
+        results = list(ex.map(run_one, jobs))
+
+    for result in results:
+        print_result(result)
+
+    total_pnl = sum(r["total_pnl"] for r in results)
+    total_trades = sum(r["trades"] for r in results)
+    print("===== PORTFOLIO =====")
+    print(f"Markets: {len(results)}")
+    print(f"Trades (SELL): {total_trades}")
+    print(f"Total PnL: {total_pnl:.2f}")
 
 
 if __name__ == "__main__":
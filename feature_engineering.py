@@ -1,93 +1,387 @@
 import argparse
+import math
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
 import pandas as pd
 import numpy as np
+from numba import njit
+from numpy.lib.stride_tricks import sliding_window_view
+
+Features = Dict[str, np.ndarray]
+
+MA_WINDOWS = [5, 10, 20, 60, 120]
+
+def _nan_like(a: np.ndarray) -> np.ndarray:
+    return np.full(len(a), np.nan)
+
+def _pad_front(values: np.ndarray, n: int) -> np.ndarray:
+    return np.concatenate([np.full(n, np.nan), values])
+
+def _rolling_mean(a: np.ndarray, window: int) -> np.ndarray:
+    if len(a) < window:
+        return _nan_like(a)
+    return _pad_front(sliding_window_view(a, window).mean(axis=1), window - 1)
+
+def _rolling_std(a: np.ndarray, window: int) -> np.ndarray:
+    if len(a) < window:
+        return _nan_like(a)
+    return _pad_front(sliding_window_view(a, window).std(axis=1, ddof=1), window - 1)
+
+def _shift(a: np.ndarray, n: int = 1) -> np.ndarray:
+    if len(a) <= n:
+        return _nan_like(a)
+    return _pad_front(a[:-n], n)
+
+def _diff(a: np.ndarray, n: int = 1) -> np.ndarray:
+    if len(a) <= n:
+        return _nan_like(a)
+    return _pad_front(np.subtract(a[n:], a[:-n]), n)
+
+def _pct_change(a: np.ndarray, n: int = 1) -> np.ndarray:
+    if len(a) <= n:
+        return _nan_like(a)
+    return _pad_front(np.subtract(a[n:], a[:-n]) / a[:-n], n)
+
+@njit(cache=True)
+def _rolling_extrema(high, low, window):
+    # rolling max of high and min of low in one pass; each queue holds bar indices
+    # with monotonic values so its head is the current window extreme
+    n = len(high)
+    rmax = np.full(n, np.nan)
+    rmin = np.full(n, np.nan)
+    qmax = np.empty(n, np.int64)
+    qmin = np.empty(n, np.int64)
+    max_head = max_tail = 0
+    min_head = min_tail = 0
+    for i in range(n):
+        while max_tail > max_head and high[qmax[max_tail - 1]] <= high[i]:
+            max_tail -= 1
+        qmax[max_tail] = i
+        max_tail += 1
+        if qmax[max_head] <= i - window:
+            max_head += 1
+
+        while min_tail > min_head and low[qmin[min_tail - 1]] >= low[i]:
+            min_tail -= 1
+        qmin[min_tail] = i
+        min_tail += 1
+        if qmin[min_head] <= i - window:
+            min_head += 1
 
-def add_trend_features(df: pd.DataFrame) -> pd.DataFrame:
-    for window in [5, 10, 20, 60, 120]:
-        df[f"ma_{window}"] = df["close"].rolling(window).mean()
-        df[f"ma_slope_{window}"] = df[f"ma_{window}"].diff()
+        if i >= window - 1:
+            rmax[i] = high[qmax[max_head]]
+            rmin[i] = low[qmin[min_head]]
+    return rmax, rmin
+
+def add_trend_features(out: Features, close: np.ndarray) -> Features:
+    for window in MA_WINDOWS:
+        out[f"ma_{window}"] = _rolling_mean(close, window)
+        out[f"ma_slope_{window}"] = _diff(out[f"ma_{window}"])
+
+    ma20, ma60, ma120 = out["ma_20"], out["ma_60"], out["ma_120"]
 
     # strict alignment (binary)
-    df["ma_alignment"] = (
-        (df["ma_20"] > df["ma_60"]) &
-        (df["ma_60"] > df["ma_120"])
-    ).astype(int)
+    out["ma_alignment"] = ((ma20 > ma60) & (ma60 > ma120)).astype(int)
 
     # softer alignment score (0, 0.5, 1.0)
-    df["ma_alignment_score"] = (
-        (df["ma_20"] > df["ma_60"]).astype(int) +
-        (df["ma_60"] > df["ma_120"]).astype(int)
-    ) / 2.0
+    out["ma_alignment_score"] = ((ma20 > ma60).astype(int) + (ma60 > ma120).astype(int)) / 2.0
 
     # distances
-    df["dist_ma20"] = (df["close"] - df["ma_20"]) / df["ma_20"]
-    df["dist_ma60"] = (df["close"] - df["ma_60"]) / df["ma_60"]
-    return df
+    out["dist_ma20"] = (close - ma20) / ma20
+    out["dist_ma60"] = (close - ma60) / ma60
+    return out
 
-def add_pullback_features(df: pd.DataFrame) -> pd.DataFrame:
-    rolling_high20 = df["high"].rolling(20).max()
-    rolling_low20 = df["low"].rolling(20).min()
-    df["pullback_depth20"] = (rolling_high20 - df["close"]) / rolling_high20
-    df["range_pos20"] = (df["close"] - rolling_low20) / (rolling_high20 - rolling_low20 + 1e-9)
+def add_pullback_features(out: Features, close: np.ndarray, high20: np.ndarray, low20: np.ndarray) -> Features:
+    out["pullback_depth20"] = (high20 - close) / high20
+    out["range_pos20"] = (close - low20) / (high20 - low20 + 1e-9)
 
-    df["ret_1"] = df["close"].pct_change(1)
-    df["ret_3"] = df["close"].pct_change(3)
-    df["ret_10"] = df["close"].pct_change(10)
+    out["ret_1"] = _pct_change(close, 1)
+    out["ret_3"] = _pct_change(close, 3)
+    out["ret_10"] = _pct_change(close, 10)
 
-    df["rebound_strength3"] = df["ret_3"]
-    df["rebound_strength10"] = df["ret_10"]
+    out["rebound_strength3"] = out["ret_3"]
+    out["rebound_strength10"] = out["ret_10"]
 
-    return df
+    return out
 
-def add_breakout_features(df: pd.DataFrame) -> pd.DataFrame:
-    high20 = df["high"].rolling(20).max()
-    low20 = df["low"].rolling(20).min()
-    df["breakout_up20"] = (df["close"] > high20.shift(1)).astype(int)
-    df["breakout_down20"] = (df["close"] < low20.shift(1)).astype(int)
+def add_breakout_features(out: Features, close: np.ndarray, high20: np.ndarray, low20: np.ndarray) -> Features:
+    out["breakout_up20"] = (close > _shift(high20)).astype(int)
+    out["breakout_down20"] = (close < _shift(low20)).astype(int)
 
-    df["range_width20"] = (high20 - low20) / df["close"]
-    df["range_width20_chg"] = df["range_width20"].diff()
-    df["volatility20"] = df["ret_1"].rolling(20).std()
-    df["volatility20_chg"] = df["volatility20"].diff()
-    return df
+    out["range_width20"] = (high20 - low20) / close
+    out["range_width20_chg"] = _diff(out["range_width20"])
+    # ret_1 comes from add_pullback_features
+    out["volatility20"] = _rolling_std(out["ret_1"], 20)
+    out["volatility20_chg"] = _diff(out["volatility20"])
+    return out
 
-def add_volume_features(df: pd.DataFrame) -> pd.DataFrame:
-    df["vol_ma20"] = df["volume"].rolling(20).mean()
-    df["vol_ma60"] = df["volume"].rolling(60).mean()
-    df["vol_ratio20"] = df["volume"] / (df["vol_ma20"] + 1e-9)
-    df["vol_ratio60"] = df["volume"] / (df["vol_ma60"] + 1e-9)
-    df["vol_z20"] = (df["volume"] - df["vol_ma20"]) / (df["volume"].rolling(20).std() + 1e-9)
-    return df
+def add_volume_features(out: Features, volume: np.ndarray) -> Features:
+    out["vol_ma20"] = _rolling_mean(volume, 20)
+    out["vol_ma60"] = _rolling_mean(volume, 60)
+    out["vol_ratio20"] = volume / (out["vol_ma20"] + 1e-9)
+    out["vol_ratio60"] = volume / (out["vol_ma60"] + 1e-9)
+    out["vol_z20"] = (volume - out["vol_ma20"]) / (_rolling_std(volume, 20) + 1e-9)
+    return out
 
-def add_momentum_features(df: pd.DataFrame) -> pd.DataFrame:
-    delta = df["close"].diff()
-    gain = delta.clip(lower=0)
-    loss = (-delta).clip(lower=0)
-
-    roll_up = gain.rolling(14).mean()
-    roll_down = loss.rolling(14).mean()
-    rs = roll_up / (roll_down + 1e-9)
-    df["rsi14"] = 100 - (100 / (1 + rs))
-
-    ema12 = df["close"].ewm(span=12, adjust=False).mean()
-    ema26 = df["close"].ewm(span=26, adjust=False).mean()
-    df["macd"] = ema12 - ema26
-    df["macd_signal"] = df["macd"].ewm(span=9, adjust=False).mean()
-    df["macd_hist"] = df["macd"] - df["macd_signal"]
-    return df
+@njit(cache=True)
+def _macd_kernel(close, a_fast, a_slow, a_signal):
+    # columns: macd, signal, hist; EMAs seeded with the first close (ewm adjust=False)
+    n = len(close)
+    out = np.empty((n, 3))
+    if n == 0:
+        return out
+    e_fast = close[0]
+    e_slow = close[0]
+    sig = 0.0
+    for i in range(n):
+        e_fast += a_fast * (close[i] - e_fast)
+        e_slow += a_slow * (close[i] - e_slow)
+        macd = e_fast - e_slow
+        sig += a_signal * (macd - sig)
+        out[i, 0] = macd
+        out[i, 1] = sig
+        out[i, 2] = macd - sig
+    return out
+
+@njit(cache=True)
+def _rsi_kernel(close, period):
+    # simple rolling mean of gains/losses over `period` deltas
+    n = len(close)
+    out = np.full(n, np.nan)
+    for i in range(period, n):
+        up = 0.0
+        down = 0.0
+        for j in range(i - period + 1, i + 1):
+            d = close[j] - close[j - 1]
+            if d > 0:
+                up += d
+            else:
+                down -= d
+        rs = (up / period) / (down / period + 1e-9)
+        out[i] = 100 - (100 / (1 + rs))
+    return out
+
+def add_momentum_features(out: Features, close: np.ndarray) -> Features:
+    out["rsi14"] = _rsi_kernel(close, 14)
+
+    macd = _macd_kernel(close, 2 / 13, 2 / 27, 2 / 10)
+    out["macd"] = macd[:, 0]
+    out["macd_signal"] = macd[:, 1]
+    out["macd_hist"] = macd[:, 2]
+    return out
+
+def generate_features(df: pd.DataFrame, dropna: bool = True) -> pd.DataFrame:
+    close = df["close"].to_numpy(np.float64)
+    high = df["high"].to_numpy(np.float64)
+    low = df["low"].to_numpy(np.float64)
+    volume = df["volume"].to_numpy(np.float64)
+
+    # shared by the pullback and breakout groups
+    high20, low20 = _rolling_extrema(high, low, 20)
 
-def generate_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df = add_trend_features(df)
-    df = add_pullback_features(df)
-    df = add_breakout_features(df)
-    df = add_volume_features(df)
-    df = add_momentum_features(df)
+    feats: Features = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        add_trend_features(feats, close)
+        add_pullback_features(feats, close, high20, low20)
+        add_breakout_features(feats, close, high20, low20)
+        add_volume_features(feats, volume)
+        add_momentum_features(feats, close)
+
+    # math above runs in float64 (long rolling sums over KRW prices); the emitted
+    # features are float32, which is what LightGBM bins on anyway
+    out = {k: v.astype(np.float32) if v.dtype == np.float64 else v for k, v in feats.items()}
+    base = df.drop(columns=[c for c in out if c in df.columns])
+    df = pd.concat([base, pd.DataFrame(out, index=df.index)], axis=1)
 
     # drop rows with NA from rolling calcs
-    df = df.dropna().reset_index(drop=True)
+    if dropna:
+        df = df.dropna().reset_index(drop=True)
     return df
 
+class _RollingVar:
+    """Sliding-window Welford mean/variance (ddof=1), O(1) per push."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values: Deque[float] = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, x: float):
+        if len(self.values) < self.window:
+            self.values.append(x)
+            delta = x - self.mean
+            self.mean += delta / len(self.values)
+            self.m2 += delta * (x - self.mean)
+            return
+        old = self.values.popleft()
+        self.values.append(x)
+        new_mean = self.mean + (x - old) / self.window
+        self.m2 += (x - old) * (x - new_mean + old - self.mean)
+        self.mean = new_mean
+
+    def std(self) -> float:
+        if len(self.values) < self.window:
+            return math.nan
+        return math.sqrt(max(self.m2 / (self.window - 1), 0.0))
+
+class IndicatorState:
+    """Streaming counterpart of generate_features for one market.
+
+    Each update() folds one closed candle into running sums, monotonic
+    deques and EMA scalars, so per-candle cost does not grow with history.
+    """
+
+    columns: List[str] = (
+        ["open", "high", "low", "close", "volume"]
+        + [c for w in MA_WINDOWS for c in (f"ma_{w}", f"ma_slope_{w}")]
+        + ["ma_alignment", "ma_alignment_score", "dist_ma20", "dist_ma60"]
+        + ["pullback_depth20", "range_pos20", "ret_1", "ret_3", "ret_10", "rebound_strength3", "rebound_strength10"]
+        + ["breakout_up20", "breakout_down20", "range_width20", "range_width20_chg", "volatility20", "volatility20_chg"]
+        + ["vol_ma20", "vol_ma60", "vol_ratio20", "vol_ratio60", "vol_z20"]
+        + ["rsi14", "macd", "macd_signal", "macd_hist"]
+    )
+
+    def __init__(self, warmup: int = 200):
+        self.warmup = warmup
+        self.count = 0
+
+        self.closes: Deque[float] = deque(maxlen=MA_WINDOWS[-1] + 1)
+        self.ma_sums = {w: 0.0 for w in MA_WINDOWS}
+        self.prev_ma = {w: math.nan for w in MA_WINDOWS}
+
+        # (bar index, value), values monotonic so the front is the window extreme
+        self.high_q: Deque[Tuple[int, float]] = deque()
+        self.low_q: Deque[Tuple[int, float]] = deque()
+        self.prev_high20 = math.nan
+        self.prev_low20 = math.nan
+        self.prev_range_width20 = math.nan
+
+        self.ret_var = _RollingVar(20)
+        self.prev_volatility20 = math.nan
+
+        self.volumes: Deque[float] = deque(maxlen=61)
+        self.vol_sums = {20: 0.0, 60: 0.0}
+        self.vol_var = _RollingVar(20)
+
+        self.gains: Deque[float] = deque(maxlen=14)
+        self.losses: Deque[float] = deque(maxlen=14)
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+
+        self.ema_fast = math.nan
+        self.ema_slow = math.nan
+        self.macd_signal = 0.0
+
+    def _rolling_extreme(self, q: Deque[Tuple[int, float]], x: float, is_max: bool) -> float:
+        t = self.count
+        while q and (q[-1][1] <= x if is_max else q[-1][1] >= x):
+            q.pop()
+        q.append((t, x))
+        if q[0][0] <= t - 20:
+            q.popleft()
+        return q[0][1] if t + 1 >= 20 else math.nan
+
+    def update(self, open_: float, high: float, low: float, close: float, volume: float) -> Optional[np.ndarray]:
+        """Fold in one closed candle; returns the feature row (ordered as `columns`) once warmed up."""
+        t = self.count
+        prev_close = self.closes[-1] if self.closes else math.nan
+        closes = self.closes
+        closes.append(close)
+        f: Dict[str, float] = {"open": open_, "high": high, "low": low, "close": close, "volume": volume}
+
+        # trend
+        for w in MA_WINDOWS:
+            self.ma_sums[w] += close
+            if len(closes) > w:
+                self.ma_sums[w] -= closes[-(w + 1)]
+            ma = self.ma_sums[w] / w if t + 1 >= w else math.nan
+            f[f"ma_{w}"] = ma
+            f[f"ma_slope_{w}"] = ma - self.prev_ma[w]
+            self.prev_ma[w] = ma
+        ma20, ma60, ma120 = f["ma_20"], f["ma_60"], f["ma_120"]
+        f["ma_alignment"] = float(ma20 > ma60 and ma60 > ma120)
+        f["ma_alignment_score"] = (int(ma20 > ma60) + int(ma60 > ma120)) / 2.0
+        f["dist_ma20"] = (close - ma20) / ma20
+        f["dist_ma60"] = (close - ma60) / ma60
+
+        # pullback
+        high20 = self._rolling_extreme(self.high_q, high, is_max=True)
+        low20 = self._rolling_extreme(self.low_q, low, is_max=False)
+        f["pullback_depth20"] = (high20 - close) / high20
+        f["range_pos20"] = (close - low20) / (high20 - low20 + 1e-9)
+        for k in (1, 3, 10):
+            base = closes[-(k + 1)] if len(closes) > k else math.nan
+            f[f"ret_{k}"] = (close - base) / base
+        f["rebound_strength3"] = f["ret_3"]
+        f["rebound_strength10"] = f["ret_10"]
+
+        # breakout
+        f["breakout_up20"] = float(close > self.prev_high20)
+        f["breakout_down20"] = float(close < self.prev_low20)
+        self.prev_high20 = high20
+        self.prev_low20 = low20
+        range_width20 = (high20 - low20) / close
+        f["range_width20"] = range_width20
+        f["range_width20_chg"] = range_width20 - self.prev_range_width20
+        self.prev_range_width20 = range_width20
+        if t >= 1:
+            self.ret_var.push(f["ret_1"])
+        volatility20 = self.ret_var.std()
+        f["volatility20"] = volatility20
+        f["volatility20_chg"] = volatility20 - self.prev_volatility20
+        self.prev_volatility20 = volatility20
+
+        # volume
+        volumes = self.volumes
+        volumes.append(volume)
+        for w in (20, 60):
+            self.vol_sums[w] += volume
+            if len(volumes) > w:
+                self.vol_sums[w] -= volumes[-(w + 1)]
+        vol_ma20 = self.vol_sums[20] / 20 if t + 1 >= 20 else math.nan
+        vol_ma60 = self.vol_sums[60] / 60 if t + 1 >= 60 else math.nan
+        self.vol_var.push(volume)
+        f["vol_ma20"] = vol_ma20
+        f["vol_ma60"] = vol_ma60
+        f["vol_ratio20"] = volume / (vol_ma20 + 1e-9)
+        f["vol_ratio60"] = volume / (vol_ma60 + 1e-9)
+        f["vol_z20"] = (volume - vol_ma20) / (self.vol_var.std() + 1e-9)
+
+        # momentum
+        if t >= 1:
+            delta = close - prev_close
+            if len(self.gains) == self.gains.maxlen:
+                self.gain_sum -= self.gains[0]
+                self.loss_sum -= self.losses[0]
+            self.gains.append(max(delta, 0.0))
+            self.losses.append(max(-delta, 0.0))
+            self.gain_sum += self.gains[-1]
+            self.loss_sum += self.losses[-1]
+        if len(self.gains) == self.gains.maxlen:
+            n = self.gains.maxlen
+            rs = (max(self.gain_sum, 0.0) / n) / (max(self.loss_sum, 0.0) / n + 1e-9)
+            f["rsi14"] = 100 - (100 / (1 + rs))
+        else:
+            f["rsi14"] = math.nan
+
+        if t == 0:
+            self.ema_fast = close
+            self.ema_slow = close
+        self.ema_fast += (2 / 13) * (close - self.ema_fast)
+        self.ema_slow += (2 / 27) * (close - self.ema_slow)
+        macd = self.ema_fast - self.ema_slow
+        self.macd_signal += (2 / 10) * (macd - self.macd_signal)
+        f["macd"] = macd
+        f["macd_signal"] = self.macd_signal
+        f["macd_hist"] = macd - self.macd_signal
+
+        self.count += 1
+        if self.count < self.warmup:
+            return None
+        return np.array([f[c] for c in self.columns], dtype=np.float32)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="inp", required=True)
@@ -1,14 +1,69 @@
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BUY = 0
+SELL = 1
+TRADE_TYPES = ("BUY", "SELL")
+
+# numeric trade fields kept as one float64 column each; NaN where a field does not apply
+_BUY_FIELDS = ("price", "qty", "spend_krw", "fee", "balance")
+_SELL_FIELDS = ("price", "pnl", "balance")
+_NUMERIC_FIELDS = ("price", "qty", "spend_krw", "fee", "balance", "pnl")
 
 class PaperTrader:
-    def __init__(self, initial_balance: float = 1_000_000, fee: float = 0.001):
+    def __init__(self, initial_balance: float = 1_000_000, fee: float = 0.001, capacity: int = 1024):
         self.initial_balance = initial_balance
         self.balance = initial_balance
         self.position = 0.0
         self.entry_price = None
         self.entry_notional = None
         self.fee = fee
-        self.history = []
+
+        # trade log, column-oriented
+        self._n = 0
+        self._time: List[datetime] = []
+        self._reason: List[Optional[str]] = []
+        self._type = np.empty(capacity, dtype=np.int8)
+        self._cols: Dict[str, np.ndarray] = {f: np.empty(capacity) for f in _NUMERIC_FIELDS}
+
+    def _record(self, timestamp: datetime, type_code: int, reason: Optional[str] = None, **values: float):
+        n = self._n
+        if n == len(self._type):
+            cap = 2 * max(n, 1)
+            self._type = np.resize(self._type, cap)
+            for f, col in self._cols.items():
+                self._cols[f] = np.resize(col, cap)
+        self._time.append(timestamp)
+        self._reason.append(reason)
+        self._type[n] = type_code
+        for f, col in self._cols.items():
+            col[n] = values.get(f, np.nan)
+        self._n = n + 1
+
+    def _record_dict(self, i: int) -> Dict[str, Any]:
+        type_code = int(self._type[i])
+        fields = _BUY_FIELDS if type_code == BUY else _SELL_FIELDS
+        rec: Dict[str, Any] = {"time": self._time[i], "type": TRADE_TYPES[type_code]}
+        rec.update((f, float(self._cols[f][i])) for f in fields)
+        if type_code == SELL:
+            rec["reason"] = self._reason[i]
+        return rec
+
+    @property
+    def history(self) -> List[Dict[str, Any]]:
+        """Trade log as a list of dicts (built on access; prefer to_dataframe)."""
+        return [self._record_dict(i) for i in range(self._n)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        n = self._n
+        data: Dict[str, Any] = {"time": self._time, "type": np.asarray(TRADE_TYPES, dtype=object)[self._type[:n]]}
+        for f in _NUMERIC_FIELDS:
+            data[f] = self._cols[f][:n].copy()
+        data["reason"] = self._reason
+        return pd.DataFrame(data)
 
     def can_buy(self):
         return self.position == 0 and self.balance > 0
@@ -32,22 +87,13 @@ class PaperTrader:
         self.entry_price = price
         self.entry_notional = spend_krw
         self.balance -= spend_krw
-        self.history.append(
-            {
-                "time": timestamp,
-                "type": "BUY",
-                "price": price,
-                "qty": qty,
-                "spend_krw": spend_krw,
-                "fee": fee_paid,
-                "balance": self.balance,
-            }
-        )
+        self._record(timestamp, BUY, price=price, qty=qty, spend_krw=spend_krw, fee=fee_paid, balance=self.balance)
         print(f"[PAPER BUY] price={price:.2f} qty={qty:.6f}")
 
-    def sell(self, price: float, timestamp: datetime, reason: str = "EXIT"):
+    def sell(self, price: float, timestamp: datetime, reason: str = "EXIT") -> Optional[float]:
+        """Close the position; returns the realized pnl, or None if flat."""
         if not self.can_sell():
-            return
+            return None
         proceeds = self.position * price * (1 - self.fee)
         entry_notional = self.entry_notional if self.entry_notional is not None else (self.position * self.entry_price)
         pnl = proceeds - entry_notional
@@ -55,20 +101,48 @@ class PaperTrader:
         self.position = 0.0
         self.entry_price = None
         self.entry_notional = None
-        self.history.append({"time": timestamp, "type": "SELL", "price": price, "pnl": pnl, "balance": self.balance, "reason": reason})
+        self._record(timestamp, SELL, reason, price=price, pnl=pnl, balance=self.balance)
         print(f"[PAPER SELL] price={price:.2f} pnl={pnl:.2f} balance={self.balance:.2f} reason={reason}")
+        return pnl
 
-    def check_tp_sl(self, high: float, low: float, timestamp: datetime, tp: float, sl: float):
+    def check_tp_sl(self, high: float, low: float, timestamp: datetime, tp: float, sl: float) -> Optional[float]:
+        """Exit on a TP/SL hit within this bar; returns the realized pnl, or None if still open."""
         if not self.can_sell():
-            return
+            return None
         tp_price = self.entry_price * (1 + tp)
         sl_price = self.entry_price * (1 - sl)
         tp_hit = high >= tp_price
         sl_hit = low <= sl_price
         if tp_hit and sl_hit:
             # Intrabar order is unknown for OHLC. Use conservative SL-first tie-break.
-            self.sell(sl_price, timestamp, "SL_TIE")
-        elif tp_hit:
-            self.sell(tp_price, timestamp, "TP")
-        elif sl_hit:
-            self.sell(sl_price, timestamp, "SL")
+            return self.sell(sl_price, timestamp, "SL_TIE")
+        if tp_hit:
+            return self.sell(tp_price, timestamp, "TP")
+        if sl_hit:
+            return self.sell(sl_price, timestamp, "SL")
+        return None
+
+    def find_tp_sl_exit(self, highs: np.ndarray, lows: np.ndarray, tp: float, sl: float) -> Optional[Tuple[int, float, str]]:
+        """Scan bars after entry for the first TP/SL hit; returns (offset, exit price, reason) or None."""
+        if not self.can_sell():
+            return None
+        tp_price = self.entry_price * (1 + tp)
+        sl_price = self.entry_price * (1 - sl)
+        n = len(highs)
+        start, block = 0, 256
+        while start < n:
+            stop = min(start + block, n)
+            hit = (highs[start:stop] >= tp_price) | (lows[start:stop] <= sl_price)
+            if hit.any():
+                j = start + int(hit.argmax())
+                tp_hit = highs[j] >= tp_price
+                sl_hit = lows[j] <= sl_price
+                if tp_hit and sl_hit:
+                    # Same SL-first tie-break as check_tp_sl.
+                    return j, sl_price, "SL_TIE"
+                if tp_hit:
+                    return j, tp_price, "TP"
+                return j, sl_price, "SL"
+            start = stop
+            block *= 2
+        return None
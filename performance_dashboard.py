@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -42,11 +43,7 @@ class PerformanceDashboard:
         sells = self.df[self.df["type"] == "SELL"].copy() if not self.df.empty else self.df
         if sells is None or sells.empty:
             return 0.0
-        equity = sells["balance"].values
-        peak = equity[0]
-        max_dd = 0.0
-        for v in equity:
-            peak = max(peak, v)
-            dd = (peak - v) / peak * 100
-            max_dd = max(max_dd, dd)
-        return max_dd
+        equity = sells["balance"].to_numpy(dtype=float)
+        peaks = np.maximum.accumulate(equity)
+        dd = (peaks - equity) / peaks * 100
+        return float(dd.max())
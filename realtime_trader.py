@@ -1,15 +1,15 @@
 import asyncio
-import json
-from collections import defaultdict, deque
+from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Deque, Dict, Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 import joblib
-import pandas as pd
+import numpy as np
+import orjson
 import websockets
 
-from feature_engineering import generate_features
+from feature_engineering import IndicatorState
 from paper_trader import PaperTrader
 from position_sizer import PositionSizer
 from risk_engine import RiskEngine
@@ -21,7 +21,6 @@ ENTRY_THRESHOLD = 0.60
 TP_PCT = 0.015
 SL_PCT = 0.009
 MODEL_PATH = "model_champion.pkl"
-HISTORY_LEN = 600
 
 @dataclass
 class Candle:
@@ -60,6 +59,8 @@ class CandleBuilder5m:
 class RealtimePaperBot:
     def __init__(self):
         self.model = joblib.load(MODEL_PATH)
+        # sklearn wrappers keep the native Booster in booster_; predict on it directly
+        self.booster = getattr(self.model, "booster_", self.model)
 
         self.risk = RiskEngine(max_daily_loss_pct=3.0, max_consecutive_losses=3, cooldown_minutes=60)
         self.sizer = PositionSizer(risk_per_trade_pct=0.30, max_allocation_pct=10.0)
@@ -68,53 +69,45 @@ class RealtimePaperBot:
         self.paper = PaperTrader(initial_balance=1_000_000, fee=0.001)
 
         self.builder = CandleBuilder5m()
-        self.history: Dict[str, Deque[Candle]] = {m: deque(maxlen=HISTORY_LEN) for m in MARKETS}
+        self.indicators: Dict[str, IndicatorState] = {m: IndicatorState() for m in MARKETS}
 
         self.open_market: Optional[str] = None
         self.open_tp: Optional[float] = None
         self.open_sl: Optional[float] = None
 
         # align columns if available
-        self.feature_names = getattr(self.model, "feature_name", lambda: None)()
-
-    def _candles_to_df(self, market: str) -> pd.DataFrame:
-        rows = [{"datetime": c.time, "open": c.open, "high": c.high, "low": c.low, "close": c.close, "volume": c.volume} for c in self.history[market]]
-        df = pd.DataFrame(rows)
-        if df.empty:
-            return df
-        return df.sort_values("datetime").reset_index(drop=True)
-
-    def _make_realtime_features(self, market: str) -> Optional[pd.DataFrame]:
-        df = self._candles_to_df(market)
-        if len(df) < 200:
+        self.feature_names = getattr(self.booster, "feature_name", lambda: None)()
+
+        # map IndicatorState columns onto the model's feature order once
+        columns = IndicatorState.columns
+        if not self.feature_names:
+            self.feature_names = list(columns)
+        slots = [i for i, c in enumerate(self.feature_names) if c in columns]
+        self._slot_idx = np.array(slots, dtype=np.intp)
+        self._col_idx = np.array([columns.index(self.feature_names[i]) for i in slots], dtype=np.intp)
+        # features the model knows but the pipeline no longer emits stay 0.0
+        self._x = np.zeros((1, len(self.feature_names)), dtype=np.float32)
+
+    def _make_realtime_features(self, row: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if row is None or np.isnan(row).any():
             return None
+        self._x[0, self._slot_idx] = row[self._col_idx]
+        return self._x
 
-        feat = generate_features(df)
-        if feat.empty:
-            return None
-
-        X = feat.drop(columns=["datetime"], errors="ignore").tail(1)
-
-        if self.feature_names:
-            for c in self.feature_names:
-                if c not in X.columns:
-                    X[c] = 0.0
-            X = X[self.feature_names]
-        return X
-
-    def _predict_proba(self, X: pd.DataFrame) -> float:
-        return float(self.model.predict(X)[0])
+    def _predict_proba(self, X: np.ndarray) -> float:
+        return float(
+            self.booster.predict(X, num_iteration=self.booster.best_iteration, predict_disable_shape_check=True)[0]
+        )
 
     def on_candle_close(self, market: str, candle: Candle):
-        self.history[market].append(candle)
+        # indicators advance on every close, whether or not we are flat
+        row = self.indicators[market].update(candle.open, candle.high, candle.low, candle.close, candle.volume)
 
         # Manage open position
         if self.open_market == market and self.paper.can_sell():
-            self.paper.check_tp_sl(high=candle.high, low=candle.low, timestamp=candle.time, tp=self.open_tp or TP_PCT, sl=self.open_sl or SL_PCT)
-            if not self.paper.can_sell():
-                last_sell = next((h for h in reversed(self.paper.history) if h.get("type") == "SELL"), None)
-                if last_sell:
-                    self.risk.record_trade_result(float(last_sell.get("pnl", 0.0)), candle.time)
+            pnl = self.paper.check_tp_sl(high=candle.high, low=candle.low, timestamp=candle.time, tp=self.open_tp or TP_PCT, sl=self.open_sl or SL_PCT)
+            if pnl is not None:
+                self.risk.record_trade_result(pnl, candle.time)
                 self.open_market = None
                 self.open_tp = None
                 self.open_sl = None
@@ -123,7 +116,7 @@ class RealtimePaperBot:
         if not self.paper.can_buy():
             return
 
-        X = self._make_realtime_features(market)
+        X = self._make_realtime_features(row)
         if X is None:
             return
 
@@ -160,12 +153,10 @@ async def websocket_run(bot: RealtimePaperBot):
             {"type": "trade", "codes": MARKETS},
             {"format": "SIMPLE"},
         ]
-        await ws.send(json.dumps(subscribe_msg))
+        await ws.send(orjson.dumps(subscribe_msg).decode("utf-8"))
         while True:
-            raw = await ws.recv()
-            if isinstance(raw, bytes):
-                raw = raw.decode("utf-8")
-            msg = json.loads(raw)
+            # Upbit sends binary frames; orjson parses the bytes without a separate decode
+            msg = orjson.loads(await ws.recv())
             bot.handle_trade_message(msg)
 
 if __name__ == "__main__":
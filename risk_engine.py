@@ -7,17 +7,20 @@ class RiskEngine:
         self.cooldown_minutes = cooldown_minutes
         self.start_of_day_balance = None
         self.current_day = None
+        # yyyymmdd of current_day; compared per call without building a date object
+        self._current_day_ord = None
         self.consecutive_losses = 0
         self.cooldown_until = None
 
     def _reset_day(self, balance: float, now: datetime):
         self.start_of_day_balance = balance
         self.current_day = now.date()
+        self._current_day_ord = now.year * 10000 + now.month * 100 + now.day
         self.consecutive_losses = 0
         self.cooldown_until = None
 
     def _check_new_day(self, balance: float, now: datetime):
-        if self.current_day != now.date():
+        if self._current_day_ord != now.year * 10000 + now.month * 100 + now.day:
             self._reset_day(balance, now)
 
     def daily_loss_pct(self, balance: float) -> float:
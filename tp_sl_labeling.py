@@ -1,46 +1,98 @@
 import argparse
 import pandas as pd
 import numpy as np
+from numba import njit
+from numpy.lib.stride_tricks import sliding_window_view
 
-def create_tp_sl_labels(
-    df: pd.DataFrame,
-    tp: float = 0.015,
-    sl: float = 0.009,
-    max_holding: int = 60,
-) -> pd.DataFrame:
-    df = df.copy()
+LABEL_CHUNK_ROWS = 1_000_000
 
-    closes = df["close"].to_numpy()
-    highs = df["high"].to_numpy()
-    lows = df["low"].to_numpy()
+@njit(cache=True)
+def _label_kernel(closes, highs, lows, tp, sl, max_holding):
+    n = len(closes)
+    labels = np.full(n, -1, dtype=np.int8)
 
-    labels = np.full(len(df), np.nan)
-
-    for i in range(len(df) - max_holding - 1):
+    for i in range(n - max_holding - 1):
         entry = closes[i]
         tp_price = entry * (1 + tp)
         sl_price = entry * (1 - sl)
 
-        future_highs = highs[i + 1 : i + 1 + max_holding]
-        future_lows = lows[i + 1 : i + 1 + max_holding]
-
-        tp_hit = np.where(future_highs >= tp_price)[0]
-        sl_hit = np.where(future_lows <= sl_price)[0]
+        tp_first = -1
+        for j in range(1, max_holding + 1):
+            if highs[i + j] >= tp_price:
+                tp_first = j
+                break
 
-        tp_first = int(tp_hit[0]) if len(tp_hit) else None
-        sl_first = int(sl_hit[0]) if len(sl_hit) else None
+        sl_first = -1
+        for j in range(1, max_holding + 1):
+            if lows[i + j] <= sl_price:
+                sl_first = j
+                break
 
-        if tp_first is None and sl_first is None:
+        if tp_first < 0 and sl_first < 0:
             continue
 
         # Tie-break rule: if both occur on the same future candle, treat as SL first.
-        if sl_first is None or (tp_first is not None and tp_first < sl_first):
+        if sl_first < 0 or (tp_first >= 0 and tp_first < sl_first):
             labels[i] = 1
         else:
             labels[i] = 0
 
-    df["label"] = labels
-    df = df.dropna(subset=["label"]).reset_index(drop=True)
+    return labels
+
+def _label_vectorized(closes, highs, lows, tp, sl, max_holding, chunk_rows=LABEL_CHUNK_ROWS):
+    n = len(closes)
+    labels = np.full(n, -1, dtype=np.int8)
+    n_rows = n - max_holding - 1
+    if n_rows <= 0:
+        return labels
+
+    # row i holds bars i+1 .. i+max_holding
+    future_highs = sliding_window_view(highs[1:], max_holding)
+    future_lows = sliding_window_view(lows[1:], max_holding)
+
+    # peak memory is chunk_rows * max_holding bools per mask
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        entry = closes[start:stop, None]
+        tp_mask = future_highs[start:stop] >= entry * (1 + tp)
+        sl_mask = future_lows[start:stop] <= entry * (1 - sl)
+
+        tp_any = tp_mask.any(axis=1)
+        sl_any = sl_mask.any(axis=1)
+        # argmax on bool returns the first True; pushed past the window when none hit
+        tp_first = np.where(tp_any, tp_mask.argmax(axis=1), max_holding)
+        sl_first = np.where(sl_any, sl_mask.argmax(axis=1), max_holding)
+
+        # Tie-break rule: if both occur on the same future candle, treat as SL first.
+        chunk = (tp_first < sl_first).astype(np.int8)
+        chunk[~(tp_any | sl_any)] = -1
+        labels[start:stop] = chunk
+
+    return labels
+
+def create_tp_sl_labels(
+    df: pd.DataFrame,
+    tp: float = 0.015,
+    sl: float = 0.009,
+    max_holding: int = 60,
+    method: str = "numba",
+) -> pd.DataFrame:
+    df = df.copy()
+
+    closes = df["close"].to_numpy(np.float64)
+    highs = df["high"].to_numpy(np.float64)
+    lows = df["low"].to_numpy(np.float64)
+
+    if method == "numba":
+        labels = _label_kernel(closes, highs, lows, float(tp), float(sl), int(max_holding))
+    elif method == "numpy":
+        labels = _label_vectorized(closes, highs, lows, float(tp), float(sl), int(max_holding))
+    else:
+        raise ValueError(f"Unknown labeling method: {method}")
+
+    # -1 marks bars where neither TP nor SL was reached within max_holding
+    df["label"] = labels.astype(np.float64)
+    df = df[labels >= 0].reset_index(drop=True)
     return df
 
 def main():
@@ -50,11 +102,12 @@ def main():
     ap.add_argument("--tp", type=float, default=0.015)
     ap.add_argument("--sl", type=float, default=0.009)
     ap.add_argument("--max_holding", type=int, default=60)
+    ap.add_argument("--method", choices=["numba", "numpy"], default="numba")
     args = ap.parse_args()
 
     df = pd.read_csv(args.inp)
     df["datetime"] = pd.to_datetime(df["datetime"])
-    labeled = create_tp_sl_labels(df, tp=args.tp, sl=args.sl, max_holding=args.max_holding)
+    labeled = create_tp_sl_labels(df, tp=args.tp, sl=args.sl, max_holding=args.max_holding, method=args.method)
     labeled.to_csv(args.out, index=False)
     print(f"Saved: {args.out} | rows={len(labeled)}")
 